@@ -1,6 +1,6 @@
 CREATE TABLE accounts(
     account_id VARCHAR PRIMARY KEY,
-    balance DECIMAL NOT NULL CHECK (balance >= 0)
+    balance NUMERIC(20,6) NOT NULL CHECK (balance >= 0)
 );
 
 CREATE TABLE symbols (
@@ -10,7 +10,7 @@ CREATE TABLE symbols (
 CREATE TABLE positions (
     account_id VARCHAR REFERENCES accounts(account_id),
     symbol VARCHAR REFERENCES symbols(symbol),
-    amount DECIMAL NOT NULL CHECK (amount >= 0),
+    amount NUMERIC(20,6) NOT NULL CHECK (amount >= 0),
     PRIMARY KEY (account_id, symbol)
 );
 
@@ -18,9 +18,9 @@ CREATE TABLE orders(
     order_id SERIAL PRIMARY KEY,
     account_id VARCHAR REFERENCES accounts(account_id),
     symbol VARCHAR REFERENCES symbols(symbol),
-    amount DECIMAL NOT NULL,
-    limit_price DECIMAL NOT NULL,
-    remaining_amount DECIMAL NOT NULL,
+    amount NUMERIC(20,6) NOT NULL,
+    limit_price NUMERIC(20,6) NOT NULL,
+    remaining_amount NUMERIC(20,6) NOT NULL,
     time_created TIMESTAMP NOT NULL DEFAULT NOW(),
     status VARCHAR NOT NULL CHECK (status IN ('open', 'executed', 'cancelled'))  
 );
@@ -28,10 +28,20 @@ CREATE TABLE orders(
 CREATE TABLE executions (
     execution_id SERIAL PRIMARY KEY,
     order_id INTEGER REFERENCES orders(order_id),
-    shares DECIMAL NOT NULL,
-    price DECIMAL NOT NULL,
+    shares NUMERIC(20,6) NOT NULL,
+    price NUMERIC(20,6) NOT NULL,
     time_executed TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
 CREATE INDEX idx_orders_symbol_status ON orders(symbol, status);
-CREATE INDEX idx_orders_account_id ON orders(account_id);
\ No newline at end of file
+CREATE INDEX idx_orders_account_id ON orders(account_id);
+
+-- Partial book indexes matching the two candidate scans in _match_order:
+-- only open orders are relevant, and each side is already sorted in the
+-- price-time priority the matcher wants, so no sort step is needed
+CREATE INDEX orders_sell_book ON orders(symbol, limit_price ASC, time_created ASC)
+    INCLUDE (account_id, amount, remaining_amount)
+    WHERE status = 'open' AND amount < 0;
+CREATE INDEX orders_buy_book ON orders(symbol, limit_price DESC, time_created ASC)
+    INCLUDE (account_id, amount, remaining_amount)
+    WHERE status = 'open' AND amount > 0;
\ No newline at end of file
@@ -1,13 +1,16 @@
 import socket
 import threading
 import multiprocessing
-import xml.etree.ElementTree as ET # short name ET for XML parsing library ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree as ET # libxml2-backed parser, API-compatible with ElementTree
 import psycopg2
 from psycopg2 import pool # connection pooling, reuse database connections instead of creating new everytime
+from psycopg2.extras import execute_values
 import time
 import logging
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
+from xml.sax.saxutils import escape, quoteattr
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,35 +28,167 @@ DB_CONFIG = {
 
 connection_pool = None
 
+# Candidates are locked and consumed in batches of this size; a huge order
+# no longer locks the whole matchable book in one go
+MATCH_BATCH_SIZE = 64
+
+# Hot statements run on every order/query/cancel; PREPARE them once per
+# backend session so PostgreSQL skips parse+plan on each execution
+PREPARED_STATEMENTS = {
+    'order_debit_balance':
+        "UPDATE accounts SET balance = balance - $1 WHERE account_id = $2 AND balance >= $1",
+    'order_debit_position':
+        "UPDATE positions SET amount = amount - $1 WHERE account_id = $2 AND symbol = $3 AND amount >= $1",
+    'order_insert':
+        "INSERT INTO orders (account_id, symbol, amount, limit_price, remaining_amount, status, time_created) "
+        "VALUES ($1, $2, $3, $4, $5, 'open', NOW()) RETURNING order_id, time_created",
+    'match_sell_candidates':
+        "SELECT order_id, account_id, amount, limit_price, remaining_amount, time_created FROM orders "
+        "WHERE symbol = $1 AND status = 'open' AND amount < 0 AND limit_price <= $2 "
+        "ORDER BY limit_price ASC, time_created ASC LIMIT $3",
+    'match_buy_candidates':
+        "SELECT order_id, account_id, amount, limit_price, remaining_amount, time_created FROM orders "
+        "WHERE symbol = $1 AND status = 'open' AND amount > 0 AND limit_price >= $2 "
+        "ORDER BY limit_price DESC, time_created ASC LIMIT $3",
+    'query_order':
+        "SELECT status, remaining_amount, amount, symbol, limit_price FROM orders WHERE order_id = $1",
+    'query_executions':
+        "SELECT shares, price, time_executed FROM executions "
+        "WHERE order_id = $1 AND shares > 0 ORDER BY time_executed",
+    'cancel_order_lock':
+        "SELECT status, remaining_amount, amount, limit_price, symbol, account_id FROM orders "
+        "WHERE order_id = $1 FOR UPDATE",
+}
+
+# lxml parsers are reusable across documents after close() but not across
+# threads, so each handler thread keeps its own hardened parser instance
+_parser_local = threading.local()
+
+def get_request_parser():
+    parser = getattr(_parser_local, 'parser', None)
+    if parser is None:
+        parser = ET.XMLParser(resolve_entities=False, no_network=True, huge_tree=False)
+        _parser_local.parser = parser
+    return parser
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Connection that tracks whether the hot statements have been prepared."""
+    statements_prepared = False
+
+def ensure_prepared(conn):
+    if conn.statements_prepared:
+        return
+    with conn.cursor() as cur:
+        for name, sql in PREPARED_STATEMENTS.items():
+            cur.execute(f"PREPARE {name} AS {sql}")
+    conn.commit()
+    conn.statements_prepared = True
+
+def format_decimal(value):
+    # NUMERIC(20,6) columns come back as Decimal('5.000000'); render the
+    # canonical digits so responses still read shares="5" like they did
+    # before the column scale was pinned
+    normalized = value.normalize()
+    # normalize() writes 500 as 5E+2; expand integer exponents back out
+    if normalized.as_tuple().exponent > 0:
+        normalized = normalized.quantize(Decimal(1))
+    return str(normalized)
+
+# Each handler thread pins the connection it drew for its lifetime: prepared
+# statements stay warm and acquire/release become attribute hits. The pool's
+# keyed getconn can't do this — putconn drops the key association, so the next
+# getconn(key) hands back an arbitrary connection. Handler threads never
+# outnumber maxconn (see __init__), so pinning can't starve the pool
+_conn_local = threading.local()
+
+def acquire_conn():
+    conn = getattr(_conn_local, 'conn', None)
+    if conn is None or conn.closed:
+        conn = connection_pool.getconn()
+        _conn_local.conn = conn
+    ensure_prepared(conn)
+    return conn
+
+def release_conn(conn):
+    if conn.closed:
+        # Broken connection: hand it back for disposal and re-draw next request
+        _conn_local.conn = None
+        connection_pool.putconn(conn, close=True)
+
 class ExchangeServer:
-    def __init__(self, host='0.0.0.0', port=12345, num_workers=4):
+    def __init__(self, host='0.0.0.0', port=12345, num_workers=4, max_handlers=24,
+                 min_conn=None, max_conn=None):
         self.host = host
         self.port = port
         self.num_workers = num_workers
+        self.max_handlers = max_handlers
+        # Every handler thread may hold a connection, so each worker's pool must
+        # be at least as large as its handler pool or getconn() serializes the
+        # server; num_workers * max_conn has to stay under PG max_connections
+        self.max_conn = max_conn if max_conn is not None else max_handlers
+        # minconn == maxconn, or putconn() closes any connection returned while
+        # minconn are already idle and everything above the floor churns through
+        # reconnect + re-PREPARE under load
+        self.min_conn = min_conn if min_conn is not None else self.max_conn
         self.socket = None
         self.workers = []
+        self.handler_pool = None
 
     def start(self):
+        if self.num_workers <= 1:
+            self._serve()
+            return
+
+        # One accept loop per process, each on its own SO_REUSEPORT socket, so
+        # the kernel spreads connections across processes and the GIL-bound
+        # XML/Decimal work scales with cores
+        logger.info(f"Starting {self.num_workers} worker processes")
+        for i in range(self.num_workers):
+            worker = multiprocessing.Process(target=self._worker_process, args=(i,))
+            worker.start()
+            self.workers.append(worker)
+
+        try:
+            for worker in self.workers:
+                worker.join()
+        except KeyboardInterrupt:
+            logger.info("Shutting down...")
+        finally:
+            self._cleanup()
+
+    def _worker_process(self, worker_id):
+        logger.info(f"Worker {worker_id} starting")
+        self._serve(reuse_port=True)
+
+    def _serve(self, reuse_port=False):
         global connection_pool
         connection_pool = psycopg2.pool.ThreadedConnectionPool(
-            minconn=1,
-            maxconn=100,
+            minconn=self.min_conn,
+            maxconn=self.max_conn,
+            connection_factory=PreparingConnection,
             **DB_CONFIG
         )
 
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.socket.bind((self.host, self.port))
         self.socket.listen(100)
 
+        # Fixed-size handler pool: bounds thread count (and therefore memory and
+        # context-switch overhead) instead of spawning one thread per connection
+        self.handler_pool = ThreadPoolExecutor(max_workers=self.max_handlers)
+
         logger.info(f"Server started on {self.host}:{self.port}")
 
         try:
             while True:
                 client_socket, address = self.socket.accept()
+                # Disable Nagle so small length-prefixed responses go out immediately
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                 logger.info(f"Accepted connection from {address}")
-                thread = threading.Thread(target=self._handle_client, args=(client_socket, address), daemon=True)
-                thread.start()
+                self.handler_pool.submit(self._handle_client, client_socket, address)
         except KeyboardInterrupt:
             logger.info("Shutting down...")
         finally:
@@ -61,41 +196,75 @@ class ExchangeServer:
 
 
     def _handle_client(self, client_socket, address):
+        rfile = client_socket.makefile('rb', buffering=65536)
         try:
-            # Read XML data length
-            # Read XML length line
-            length_line = b''
-            while b'\n' not in length_line:
-                chunk = client_socket.recv(1)
-                if not chunk:
-                    break
-                length_line += chunk
-
-            message_len = int(length_line.decode().strip())
-            received_data = b''
-            while len(received_data) < message_len:
-                chunk = client_socket.recv(min(4096, message_len - len(received_data)))
-                if not chunk:
-                    break
-                received_data += chunk
-
-            xml_data = received_data.decode()
-
-            response = self._process_xml(xml_data)
+            # Keep-alive: serve length-prefixed requests on this connection
+            # until the client closes it, so steady-state clients pay the TCP
+            # handshake once instead of per request
+            while True:
+                # Buffered reads: one readline for the length prefix, then bulk
+                # reads for the body, instead of one recv() syscall per byte
+                length_line = rfile.readline()
+                if not length_line:
+                    return
+
+                message_len = int(length_line.decode().strip())
+
+                # Feed the parser as chunks arrive so parsing overlaps the
+                # network read instead of waiting for the full body to buffer
+                parser = get_request_parser()
+                remaining = message_len
+                try:
+                    while remaining > 0:
+                        chunk = rfile.read(min(65536, remaining))
+                        if not chunk:
+                            _parser_local.parser = None
+                            logger.error(f"Client {address} closed connection mid-message")
+                            return
+                        remaining -= len(chunk)
+                        parser.feed(chunk)
+                    root = parser.close()
+                except ET.XMLSyntaxError as e:
+                    # discard the cached parser rather than reuse one left mid-parse
+                    _parser_local.parser = None
+                    logger.error(f"XML parsing error: {e}")
+                    # Drain the rest of the declared body so the next readline
+                    # sees the next request's length prefix, not a tail of this
+                    # one — otherwise the keep-alive framing desyncs
+                    while remaining > 0:
+                        chunk = rfile.read(min(65536, remaining))
+                        if not chunk:
+                            return
+                        remaining -= len(chunk)
+                    response = "<results><error>Invalid XML format</error></results>"
+                else:
+                    response = self._process_xml(root)
 
-            response_bytes = response.encode()
-            client_socket.sendall(f"{len(response_bytes)}\n".encode())
-            client_socket.sendall(response_bytes)
+                response_bytes = response.encode()
+                self._send_response(client_socket, response_bytes)
 
         except Exception as e:
             logger.error(f"Error handling client {address}: {e}")
         finally:
+            rfile.close()
             client_socket.close()
 
-    def _process_xml(self, xml_data):
+    @staticmethod
+    def _send_response(client_socket, response_bytes):
+        # Scatter-gather write: header and body go out in one syscall (and one
+        # segment) without first concatenating them into a fresh buffer
+        header = f"{len(response_bytes)}\n".encode()
+        buffers = [memoryview(header), memoryview(response_bytes)]
+        while buffers:
+            sent = client_socket.sendmsg(buffers)
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                del buffers[0]
+            if buffers and sent:
+                buffers[0] = buffers[0][sent:]
+
+    def _process_xml(self, root):
         try:
-            root = ET.fromstring(xml_data)
-
             if root.tag == 'create':
                 return self._handle_create(root)
             elif root.tag == 'transactions':
@@ -103,145 +272,204 @@ class ExchangeServer:
             else:
                 logger.warning(f"Unknown XML root tag: {root.tag}")
                 return "<results><error>Unknown request type</error></results>"
-            
-        except ET.ParseError as e:
-            logger.error(f"XML parsing error: {e}")
-            return "<results><error>Invalid XML format</error></results>"
+
         except Exception as e:
             logger.error(f"Error processing XML: {e}")
             return "<results><error>Internal server error</error></results>"
         
     def _handle_create(self, create_node):
-        conn = connection_pool.getconn()
+        conn = acquire_conn()
         try:
             results = []
+            account_rows = []
+            symbol_rows = []
+            position_rows = [] # (result slot, account_id, symbol, amount)
 
+            # First pass: validate every child in document order and collect rows,
+            # so each table gets one batched INSERT instead of one per child
             for child in create_node:
                 if child.tag == 'account':
                     account_id = child.get('id')
                     balance_str = child.get('balance')
 
                     if not account_id or not balance_str:
-                        results.append(f'<error id="{account_id}">Missing required attributes</error>')
+                        results.append(f'<error id={quoteattr(account_id or "")}>Missing required attributes</error>')
                         continue
 
                     try:
                         balance = Decimal(balance_str)
                     except (TypeError, InvalidOperation):
-                        results.append(f'<error id="{account_id}">Invalid balance value</error>')
+                        results.append(f'<error id={quoteattr(account_id)}>Invalid balance value</error>')
                         continue
 
-                    with conn.cursor() as cur:
-                        try:
-                            cur.execute(
-                                "INSERT INTO accounts (account_id, balance) VALUES (%s, %s) ON CONFLICT (account_id) DO NOTHING",
-                                (account_id, balance)
-                            )
-                            conn.commit()
-                            results.append(f'<created id="{account_id}"/>')
-                        except Exception as e:
-                            conn.rollback()
-                            logger.error(f"Error inserting account {account_id}: {e}")
-                            results.append(f'<error id="{account_id}">Database error</error>')
+                    # Catch values the table's CHECK constraint would reject here,
+                    # so one bad child can't abort the whole batched INSERT
+                    if balance < 0:
+                        results.append(f'<error id={quoteattr(account_id)}>Invalid balance value</error>')
+                        continue
+
+                    account_rows.append((account_id, balance))
+                    results.append(f'<created id={quoteattr(account_id)}/>')
 
                 elif child.tag == 'symbol':
                     symbol = child.get('sym')
-
-                    with conn.cursor() as cur:
-                        try:
-                            cur.execute(
-                                "INSERT INTO symbols (symbol) VALUES (%s) ON CONFLICT DO NOTHING",
-                                (symbol,)
-                            )
-                            conn.commit()
-                        except Exception as e:
-                            conn.rollback()
-                            logger.error(f"Error creating symbol {symbol}: {e}")
+                    if not symbol:
+                        results.append('<error sym="">Missing required attributes</error>')
+                        continue
+                    symbol_rows.append((symbol,))
 
                     for account_node in child:
                         if account_node.tag == 'account':
                             account_id = account_node.get('id')
                             amount = account_node.text.strip() if account_node.text else "0"
 
+                            if not account_id:
+                                results.append(f'<error sym={quoteattr(symbol)} id="">Account does not exist</error>')
+                                continue
+
                             try:
                                 amount = Decimal(amount)
                             except (TypeError, InvalidOperation):
-                                results.append(f'<error sym="{symbol}" id="{account_id}">Invalid amount</error>')
+                                results.append(f'<error sym={quoteattr(symbol)} id={quoteattr(account_id or "")}>Invalid amount</error>')
                                 continue
 
-                            with conn.cursor() as cur:
-                                try:
-                                    cur.execute("SELECT 1 FROM accounts WHERE account_id = %s", (account_id,))
-                                    if cur.fetchone() is None:
-                                        results.append(f'<error sym="{symbol}" id="{account_id}">Account does not exist</error>')
-                                        continue
-
-                                    cur.execute("""
-                                        INSERT INTO positions (account_id, symbol, amount)
-                                        VALUES (%s, %s, %s)
-                                        ON CONFLICT (account_id, symbol)
-                                        DO UPDATE SET amount = positions.amount + EXCLUDED.amount
-                                    """, (account_id, symbol, amount))
-                                    conn.commit()
-                                    results.append(f'<created sym="{symbol}" id="{account_id}"/>')
-                                except Exception as e:
-                                    conn.rollback()
-                                    logger.error(f"Error adding position for {account_id}, {symbol}: {e}")
-                                    results.append(f'<error sym="{symbol}" id="{account_id}">Database error</error>')
+                            if amount < 0:
+                                results.append(f'<error sym={quoteattr(symbol)} id={quoteattr(account_id or "")}>Invalid amount</error>')
+                                continue
+
+                            position_rows.append((len(results), account_id, symbol, amount))
+                            results.append(None) # filled in once account existence is known
 
+            with conn.cursor() as cur:
+                if account_rows:
+                    execute_values(
+                        cur,
+                        "INSERT INTO accounts (account_id, balance) VALUES %s ON CONFLICT (account_id) DO NOTHING",
+                        account_rows
+                    )
+
+                if symbol_rows:
+                    execute_values(
+                        cur,
+                        "INSERT INTO symbols (symbol) VALUES %s ON CONFLICT DO NOTHING",
+                        symbol_rows
+                    )
+
+                if position_rows:
+                    # Accounts inserted above are visible here, so positions can
+                    # reference accounts created earlier in the same request
+                    cur.execute(
+                        "SELECT account_id FROM accounts WHERE account_id = ANY(%s)",
+                        ([row[1] for row in position_rows],)
+                    )
+                    known_accounts = {row[0] for row in cur.fetchall()}
+
+                    # Sum repeated (account, symbol) pairs before the upsert:
+                    # ON CONFLICT DO UPDATE refuses to touch the same row twice
+                    # in one statement, so duplicates must collapse here
+                    position_upserts = {}
+                    for slot, account_id, symbol, amount in position_rows:
+                        if account_id not in known_accounts:
+                            results[slot] = f'<error sym={quoteattr(symbol)} id={quoteattr(account_id)}>Account does not exist</error>'
+                        else:
+                            key = (account_id, symbol)
+                            position_upserts[key] = position_upserts.get(key, Decimal(0)) + amount
+                            results[slot] = f'<created sym={quoteattr(symbol)} id={quoteattr(account_id)}/>'
+
+                    if position_upserts:
+                        execute_values(cur, """
+                            INSERT INTO positions (account_id, symbol, amount)
+                            VALUES %s
+                            ON CONFLICT (account_id, symbol)
+                            DO UPDATE SET amount = positions.amount + EXCLUDED.amount
+                        """, [(acct, sym, amt) for (acct, sym), amt in position_upserts.items()])
+
+            conn.commit()
             return f"<results>{''.join(results)}</results>"
-        
+
         except Exception as e:
             conn.rollback()
             logger.error(f"Error in handle_create: {e}")
             return "<results><error>Internal server error</error></results>"
         finally:
-            connection_pool.putconn(conn)
+            release_conn(conn)
                                 
     def _handle_transaction(self, transactions_node):
         account_id = transactions_node.get('id')
-        conn = connection_pool.getconn()
+        conn = acquire_conn()
         try:
             with conn.cursor() as cur:
-                cur.execute("SELECT 1 FROM accounts WHERE account_id = %s", (account_id,))
-                # Account doesn't exsit, return error for all transactions
-                if cur.fetchone() is None:
-                    error_results = []
-                    for child in transactions_node:
+                # Advisory locks are held to the end-of-request commit, so two
+                # envelopes taking symbols in different child order would
+                # deadlock against each other. Lock every symbol this request
+                # can touch up front, in sorted order, so acquisition order is
+                # the same across requests; the per-child acquisitions below
+                # are then re-entrant no-ops
+                symbols = {child.get('sym') for child in transactions_node
+                           if child.tag == 'order' and child.get('sym')}
+                cancel_ids = []
+                for child in transactions_node:
+                    if child.tag == 'cancel':
+                        try:
+                            cancel_ids.append(int(child.get('id')))
+                        except (TypeError, ValueError):
+                            pass
+                if cancel_ids:
+                    cur.execute("SELECT DISTINCT symbol FROM orders WHERE order_id = ANY(%s)",
+                                (cancel_ids,))
+                    symbols.update(row[0] for row in cur.fetchall())
+                for symbol in sorted(symbols):
+                    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (symbol,))
+
+                # No upfront account probe: the debit UPDATE in _handle_order
+                # already fails for a missing account, and query/cancel fail
+                # on the order lookup, so each child reports its own error
+                results = []
+                for child in transactions_node:
+                    if child.tag not in ('order', 'query', 'cancel'):
+                        logger.warning(f"Unknown transaction type: {child.tag}")
+                        continue
+
+                    # Savepoint per child: a failing child rolls back alone while
+                    # the rest of the request still commits once at the end
+                    cur.execute("SAVEPOINT txn_child")
+                    try:
                         if child.tag == 'order':
-                            sym = child.get('sym', '')
-                            amount = child.get('amount', '')
-                            limit = child.get('limit','')
-                            error_results.append(f'<error sym="{sym}" amount="{amount}" limit="{limit}">Invalid account</error>')
-                        elif child.tag == 'query' or child.tag == 'cancel':
-                            trans_id = child.get('id', '')
-                            error_results.append(f'<error id="{trans_id}">Invalid account</error>')
-
-                    return f"<results>{''.join(error_results)}</results>"
-                
-            results = []
-            for child in transactions_node:
-                if child.tag == 'order':
-                    result = self._handle_order(conn, account_id, child)
-                elif child.tag == 'query':
-                    result = self._handle_query(conn, account_id, child)
-                elif child.tag == 'cancel':
-                    result = self._handle_cancel(conn, account_id, child)
-                else:
-                    logger.warning(f"Unknown transaction type: {child.tag}")
-                    continue
+                            result = self._handle_order(cur, account_id, child)
+                        elif child.tag == 'query':
+                            result = self._handle_query(cur, account_id, child)
+                        else:
+                            result = self._handle_cancel(cur, account_id, child)
+                        cur.execute("RELEASE SAVEPOINT txn_child")
+                    except Exception as e:
+                        cur.execute("ROLLBACK TO SAVEPOINT txn_child")
+                        logger.error(f"Error processing {child.tag}: {e}")
+                        if child.tag == 'order':
+                            result = (f'<error sym={quoteattr(child.get("sym") or "")} amount={quoteattr(child.get("amount") or "")} '
+                                      f'limit={quoteattr(child.get("limit") or "")}>Database error: {escape(str(e))}</error>')
+                        else:
+                            result = f'<error id={quoteattr(child.get("id") or "")}>Database error: {escape(str(e))}</error>'
 
-                results.append(result)
+                    results.append(result)
 
+            conn.commit()
             return f"<results>{''.join(results)}</results>"
         except Exception as e:
             conn.rollback()
             logger.error(f"Error in handle_transcations: {e}")
             return "<results><error>Internal server error</error></results>"
         finally:
-            connection_pool.putconn(conn)
+            release_conn(conn)
+
+    @staticmethod
+    def _debit_failure_reason(cur, account_id, insufficient):
+        # Only a failed debit pays for this probe, so the happy path stays
+        # at zero extra round-trips while the error message still tells a
+        # missing account apart from a real shortfall
+        cur.execute("SELECT 1 FROM accounts WHERE account_id = %s", (account_id,))
+        return insufficient if cur.fetchone() else 'Invalid account'
 
-    def _handle_order(self, conn, account_id, order_node):
+    def _handle_order(self, cur, account_id, order_node):
         symbol = order_node.get('sym')
         amount_str = order_node.get('amount')
         limit_str = order_node.get('limit')
@@ -250,336 +478,297 @@ class ExchangeServer:
             amount = Decimal(amount_str)
             limit_price = Decimal(limit_str)
         except (InvalidOperation, TypeError):
-            return f'<error sym="{symbol}" amount="{amount_str}" limit="{limit_str}">Invalid amount or limit value</error>'
+            return f'<error sym={quoteattr(symbol or "")} amount={quoteattr(amount_str or "")} limit={quoteattr(limit_str or "")}>Invalid amount or limit value</error>'
         
         is_buy = amount > 0
         abs_amount = abs(amount)
 
-        try:
-            with conn.cursor() as cur:
-                if is_buy:
-                    cur.execute("SELECT balance FROM accounts WHERE account_id = %s FOR UPDATE", (account_id,))
-                    row = cur.fetchone() #get the info like balance, account_id
-                    if row is None:
-                        return f'<error sym="{symbol}" amount="{amount_str}" limit="{limit_str}">Account not found</error>'
-
-                    balance = Decimal(row[0])
-                    limit_cost = amount * limit_price
-
-                    if balance < limit_cost:
-                        return f'<error sym="{symbol}" amount="{amount_str}" limit="{limit_str}">Insufficient funds</error>'
-                    
-                    cur.execute(
-                        "UPDATE accounts SET balance = balance - %s WHERE account_id = %s",
-                        (limit_cost, account_id)
-                    )
-                else:
-                    cur.execute(
-                        "SELECT amount FROM positions WHERE account_id = %s AND symbol = %s FOR UPDATE",
-                        (account_id, symbol)
-                    )
-                    row = cur.fetchone()
+        # Conditional UPDATE does check + debit in one statement; a zero
+        # rowcount means the funds/shares check failed (or no such row)
+        # The advisory lock comes first, before any row is locked: matching
+        # updates other accounts' balances under this lock, so taking it
+        # after the debit would invert lock order against concurrent orders
+        # on the same symbol and deadlock
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (symbol,))
 
-                    if row is None or Decimal(row[0]) < abs_amount:
-                        return f'<error sym="{symbol}" amount="{amount_str}" limit="{limit_str}">Insufficient shares</error>'
-                    
-                    cur.execute(
-                        "UPDATE positions SET amount = amount - %s WHERE account_id = %s AND symbol = %s",
-                        (abs_amount, account_id, symbol)
-                    )
+        if is_buy:
+            limit_cost = amount * limit_price
+            cur.execute(
+                "EXECUTE order_debit_balance (%s, %s)",
+                (limit_cost, account_id)
+            )
+            if cur.rowcount == 0:
+                reason = self._debit_failure_reason(cur, account_id, 'Insufficient funds')
+                return f'<error sym={quoteattr(symbol)} amount={quoteattr(amount_str)} limit={quoteattr(limit_str)}>{reason}</error>'
+        else:
+            cur.execute(
+                "EXECUTE order_debit_position (%s, %s, %s)",
+                (abs_amount, account_id, symbol)
+            )
+            if cur.rowcount == 0:
+                reason = self._debit_failure_reason(cur, account_id, 'Insufficient shares')
+                return f'<error sym={quoteattr(symbol)} amount={quoteattr(amount_str)} limit={quoteattr(limit_str)}>{reason}</error>'
 
-                cur.execute(
-                    """
-                    INSERT INTO orders (account_id, symbol, amount, limit_price, remaining_amount, status, time_created)
-                    VALUES (%s, %s, %s, %s, %s, 'open', NOW())
-                    RETURNING order_id, time_created
-                    """,
-                    (account_id, symbol, amount, limit_price, abs(amount))
-                )
+        cur.execute(
+            "EXECUTE order_insert (%s, %s, %s, %s, %s)",
+            (account_id, symbol, amount, limit_price, abs(amount))
+        )
 
-                order_id, order_time = cur.fetchone()
+        order_id, order_time = cur.fetchone()
 
-                self._match_order(conn, order_id, symbol, amount, limit_price, account_id, order_time)
+        self._match_order(cur, order_id, symbol, amount, limit_price, account_id, order_time)
 
-                conn.commit()
-                return f'<opened sym="{symbol}" amount="{amount_str}" limit="{limit_str}" id="{order_id}"/>'
-        
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Error processing order: {e}")
-            return f'<error sym="{symbol}" amount="{amount_str}" limit="{limit_str}">Database error: {e}</error>'
-        
+        return f'<opened sym={quoteattr(symbol)} amount={quoteattr(amount_str)} limit={quoteattr(limit_str)} id="{order_id}"/>'
 
-    def _match_order(self, conn, order_id, symbol, amount, limit, account_id, order_time):
+
+    def _match_order(self, cur, order_id, symbol, amount, limit, account_id, order_time):
         is_buy = amount > 0
-        abs_amount = abs(amount)
-        remaining_amount = abs_amount
-        
-        with conn.cursor() as cur:
-            if is_buy:
-                cur.execute(
-                    """
-                    SELECT order_id, account_id, amount, limit_price, remaining_amount, time_created FROM orders
-                    WHERE symbol = %s AND status = 'open' AND amount < 0 AND limit_price <= %s
-                    ORDER BY limit_price ASC, time_created ASC
-                    FOR UPDATE
-                    """,
-                    (symbol, limit)
-                )
-            else:
-                cur.execute(
-                    """
-                    SELECT order_id, account_id, amount, limit_price, remaining_amount, time_created FROM orders
-                    WHERE symbol = %s AND status = 'open' AND amount > 0 AND limit_price >= %s
-                    ORDER BY limit_price DESC, time_created ASC
-                    FOR UPDATE
-                    """,
-                    (symbol, limit)
-                )
+        remaining_amount = abs(amount)
+
+        # _handle_order already holds this symbol's advisory lock, taken
+        # before any row lock; it serializes all matching (and cancels) for
+        # the symbol across every worker process and releases at commit
+
+        if is_buy:
+            scan = "EXECUTE match_sell_candidates (%s, %s, %s)"
+        else:
+            scan = "EXECUTE match_buy_candidates (%s, %s, %s)"
+
+        # Bounded scans: consume the book in batches instead of reading every
+        # matchable resting order up front. Each batch's fills are flushed
+        # before the next scan, so consumed candidates come back with status
+        # 'executed' and drop out of the partial index
+        while remaining_amount > 0:
+            cur.execute(scan, (symbol, limit, MATCH_BATCH_SIZE))
             matching_orders = cur.fetchall()
+            if not matching_orders:
+                break
 
+            # Plan this batch's fills in Python first; the advisory lock keeps
+            # the candidates stable, so applying them can be one set-based
+            # statement instead of ~8 statements per match
+            fills = [] # (match_id, match_account, execution_amount, execution_price)
             for match in matching_orders:
                 if remaining_amount <= 0:
                     break
 
                 match_id, match_account, match_amount, match_price, match_remaining, match_time = match
 
-                execution_price = Decimal(match_price) if match_time < order_time else limit
-                execution_amount = min(remaining_amount, Decimal(match_remaining))
-
-                cur.execute(
-                    """ 
-                    INSERT INTO executions (order_id, shares, price, time_executed)
-                    VALUES (%s, %s, %s, NOW())
-                    """,
-                    (order_id, execution_amount, execution_price)
-                )
-
-                cur.execute(
-                    """ 
-                    INSERT INTO executions (order_id, shares, price, time_executed)
-                    VALUES (%s, %s, %s, NOW())
-                    """,
-                    (match_id, execution_amount, execution_price)
-                )
-
-                cur.execute(
-                    "UPDATE orders SET remaining_amount = remaining_amount - %s WHERE order_id = %s",
-                    (execution_amount, order_id)
-                )
-
-                cur.execute(
-                    "UPDATE orders SET remaining_amount = remaining_amount - %s WHERE order_id = %s",
-                    (execution_amount, match_id)
-                )
-
-                cur.execute(
-                    "UPDATE orders SET status = CASE WHEN remaining_amount = 0 THEN 'executed' ELSE status END WHERE order_id = %s",
-                    (match_id,)
-                )
+                # psycopg2 already returns NUMERIC columns as Decimal; no re-wrap
+                execution_price = match_price if match_time < order_time else limit
+                execution_amount = min(remaining_amount, match_remaining)
+                fills.append((match_id, match_account, execution_amount, execution_price))
+                remaining_amount -= execution_amount
 
-                if is_buy:
-                    buyer = account_id
-                    seller = match_account
-                else:
-                    buyer = match_account
-                    seller = account_id
+            self._apply_fills(cur, order_id, symbol, account_id, is_buy, limit, fills)
 
-                buyer_credit = execution_amount * execution_price
-                cur.execute(
-                    "UPDATE accounts SET balance = balance + %s WHERE account_id = %s",
-                    (buyer_credit, seller)
-                )
+            if len(matching_orders) < MATCH_BATCH_SIZE:
+                break
 
-                cur.execute(
-                    """
-                    INSERT INTO positions (account_id, symbol, amount)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (account_id, symbol)
-                    DO UPDATE SET amount = positions.amount + EXCLUDED.amount
-                    """,
-                    (buyer, symbol, execution_amount)
-                )
+    def _apply_fills(self, cur, order_id, symbol, account_id, is_buy, limit, fills):
+        if fills:
+            total_filled = sum(fill[2] for fill in fills)
 
-                if is_buy and execution_price < limit:
-                    refund = execution_amount * (limit - execution_price)
-                    cur.execute(
-                        "UPDATE accounts SET balance = balance + %s WHERE account_id = %s",
-                        (refund, account_id)
-                    )
-                remaining_amount -= execution_amount
+            def lit(value):
+                # execute_values owns the single %s placeholder for the fills
+                # VALUES list, so every other scalar is quoted up front
+                return cur.mogrify("%s", (value,)).decode()
 
-                cur.execute(
-                    "UPDATE orders SET status = CASE WHEN remaining_amount = 0 THEN 'executed' ELSE status END WHERE order_id = %s",
-                    (match_id,)
+            # Per-account money deltas and the position upsert depend on the
+            # side: a buy credits each seller and hands the buyer the shares
+            # (plus a refund for fills below the limit), a sell credits the
+            # seller once and hands each buyer its share of the fills.
+            # Folding the refund into the delta aggregation also keeps a
+            # self-matching account down to one row update
+            if is_buy:
+                refund = sum((limit - ep) * ea for _, _, ea, ep in fills if ep < limit)
+                account_deltas = f"""
+                        SELECT match_account AS account_id, SUM(fill * price) AS delta
+                        FROM fills GROUP BY match_account
+                        UNION ALL
+                        SELECT {lit(account_id)}, {lit(refund)}"""
+                position_rows = f"SELECT {lit(account_id)}, {lit(symbol)}, {lit(total_filled)}"
+            else:
+                account_deltas = f"""
+                        SELECT {lit(account_id)} AS account_id, SUM(fill * price) AS delta
+                        FROM fills"""
+                position_rows = f"SELECT match_account, {lit(symbol)}, SUM(fill) FROM fills GROUP BY match_account"
+
+            # One writable-CTE statement applies the whole match outcome:
+            # both sides' execution rows, remaining amounts and statuses
+            # (folded into the same UPDATE so no row is touched twice),
+            # balance deltas, and the position upsert
+            execute_values(
+                cur,
+                f"""
+                WITH fills (match_id, match_account, fill, price) AS (VALUES %s),
+                ins_exec AS (
+                    INSERT INTO executions (order_id, shares, price, time_executed)
+                    SELECT match_id, fill, price, NOW() FROM fills
+                    UNION ALL
+                    SELECT {lit(order_id)}, fill, price, NOW() FROM fills
+                ),
+                upd_matches AS (
+                    UPDATE orders
+                    SET remaining_amount = orders.remaining_amount - f.fill,
+                        status = CASE WHEN orders.remaining_amount - f.fill = 0
+                                      THEN 'executed' ELSE orders.status END
+                    FROM fills f
+                    WHERE orders.order_id = f.match_id
+                ),
+                upd_self AS (
+                    UPDATE orders
+                    SET remaining_amount = remaining_amount - {lit(total_filled)},
+                        status = CASE WHEN remaining_amount - {lit(total_filled)} = 0
+                                      THEN 'executed' ELSE status END
+                    WHERE order_id = {lit(order_id)}
+                ),
+                upd_accounts AS (
+                    UPDATE accounts
+                    SET balance = accounts.balance + d.delta
+                    FROM (SELECT account_id, SUM(delta) AS delta
+                          FROM ({account_deltas}) deltas
+                          GROUP BY account_id) d
+                    WHERE accounts.account_id = d.account_id AND d.delta <> 0
                 )
-
-            # Final status update for the original order
-            cur.execute(
-                "UPDATE orders SET status = CASE WHEN remaining_amount = 0 THEN 'executed' ELSE status END WHERE order_id = %s",
-                (order_id,)
+                INSERT INTO positions (account_id, symbol, amount)
+                {position_rows}
+                ON CONFLICT (account_id, symbol)
+                DO UPDATE SET amount = positions.amount + EXCLUDED.amount
+                """,
+                fills
             )
 
-    def _handle_query(self, conn, account_id, query_node):
+    def _handle_query(self, cur, account_id, query_node):
         trans_id = query_node.get('id')
         
         try:
             trans_id = int(trans_id)
         except ValueError:
-            return f'<error id="{trans_id}">Invalid transaction ID</error>'
+            return f'<error id={quoteattr(trans_id or "")}>Invalid transaction ID</error>'
         
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT status, remaining_amount, amount, symbol, limit_price
-                    FROM orders
-                    WHERE order_id = %s
-                    """,
-                    (trans_id,)
-                )
+        cur.execute("EXECUTE query_order (%s)", (trans_id,))
 
-                order_row = cur.fetchone()
-                if order_row is None:
-                    return f'<error id="{trans_id}">Order not found</error>'
-                
-                status, remaining, amount, symbol, limit_price = order_row
+        order_row = cur.fetchone()
+        if order_row is None:
+            return f'<error id="{trans_id}">Order not found</error>'
 
-                status_xml = f'<status id="{trans_id}">'
-                if status == 'open' and remaining > 0:
-                    status_xml += f'<open shares="{remaining}"/>'
+        status, remaining, amount, symbol, limit_price = order_row
 
-                if status == 'canceled':
-                    cur.execute(
-                        "SELECT MAX(time_executed) FROM executions WHERE order_id = %s AND shares = 0",
-                        (trans_id,)
-                    )
-                    cancel_time = cur.fetchone()[0]
-                    unix_time = int(cancel_time.timestamp())
-                    status_xml += f'<canceled shares="{remaining}" time="{unix_time}"/>'
-
-                cur.execute(
-                    """
-                    SELECT shares, price, time_executed FROM executions
-                    WHERE order_id = %s AND shares > 0
-                    ORDER BY time_executed
-                    """,
-                    (trans_id,)
-                )
+        # Accumulate fragments in a list and join once; += concatenation is
+        # quadratic for orders with long execution histories
+        parts = [f'<status id="{trans_id}">']
+        if status == 'open' and remaining > 0:
+            parts.append(f'<open shares="{format_decimal(remaining)}"/>')
 
-                executions = cur.fetchall()
-                for shares, price, time_executed in executions:
-                    unix_time = int(time_executed.timestamp())
-                    status_xml += f'<executed shares="{shares}" price="{price}" time="{unix_time}"/>'
+        if status == 'canceled':
+            cur.execute(
+                "SELECT MAX(time_executed) FROM executions WHERE order_id = %s AND shares = 0",
+                (trans_id,)
+            )
+            cancel_time = cur.fetchone()[0]
+            unix_time = int(cancel_time.timestamp())
+            parts.append(f'<canceled shares="{format_decimal(remaining)}" time="{unix_time}"/>')
 
-                status_xml += '</status>'
-                return status_xml
-        
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Error processing query: {e}")
-            return f'<error id="{trans_id}">Database error: {e}</error>'
+        cur.execute("EXECUTE query_executions (%s)", (trans_id,))
 
+        executions = cur.fetchall()
+        for shares, price, time_executed in executions:
+            unix_time = int(time_executed.timestamp())
+            parts.append(f'<executed shares="{format_decimal(shares)}" price="{format_decimal(price)}" time="{unix_time}"/>')
 
-    def _handle_cancel(self, conn, account_id, cancel_node):
+        parts.append('</status>')
+        return ''.join(parts)
+
+
+    def _handle_cancel(self, cur, account_id, cancel_node):
         trans_id = cancel_node.get('id')
 
         try:
             trans_id = int(trans_id)
         except ValueError:
-            return f'<error id="{trans_id}">Invalid transaction ID</error>'
+            return f'<error id={quoteattr(trans_id or "")}>Invalid transaction ID</error>'
         
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT status, remaining_amount, amount, limit_price, symbol, account_id
-                    FROM orders
-                    WHERE order_id = %s
-                    FOR UPDATE
-                    """,
-                    (trans_id,)
-                )
+        # The candidate scans no longer row-lock the book, so a cancel must
+        # join the same per-symbol advisory lock the matcher uses. The symbol
+        # comes from a plain read first; taking advisory before row lock
+        # keeps the lock order consistent with _match_order (no deadlocks)
+        cur.execute("SELECT symbol FROM orders WHERE order_id = %s", (trans_id,))
+        symbol_row = cur.fetchone()
+        if symbol_row is None:
+            return f'<error id="{trans_id}">Order not found</error>'
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (symbol_row[0],))
+
+        cur.execute("EXECUTE cancel_order_lock (%s)", (trans_id,))
+
+        order_row = cur.fetchone()
+        if order_row is None:
+            return f'<error id="{trans_id}">Order not found</error>'
+
+        status, remaining, amount, limit_price, symbol, order_account = order_row
+
+        if status != 'open' or remaining <= 0:
+            return f'<error id="{trans_id}">Order cannot be canceled</error>'
+
+        cur.execute(
+            """
+            UPDATE orders
+            SET status = 'cancelled'
+            WHERE order_id = %s
+            """,
+            (trans_id,)
+        )
 
-                order_row = cur.fetchone()
-                if order_row is None:
-                    return f'<error id="{trans_id}">Order not found</error>'
-                
-                status, remaining, amount, limit_price, symbol, order_account = order_row
-
-                if status != 'open' or remaining <= 0:
-                    return f'<error id="{trans_id}">Order cannot be canceled</error>'
-                
-                cur.execute(
-                    """
-                    UPDATE orders
-                    SET status = 'cancelled'
-                    WHERE order_id = %s
-                    """,
-                    (trans_id,)
-                )
+        now = datetime.now()
+        cur.execute(
+            """
+            INSERT INTO executions (order_id, shares, price, time_executed)
+            VALUES (%s, 0, 0, %s)
+            """,
+            (trans_id, now)
+        )
 
-                now = datetime.now()
-                cur.execute(
-                    """
-                    INSERT INTO executions (order_id, shares, price, time_executed)
-                    VALUES (%s, 0, 0, %s)
-                    """,
-                    (trans_id, now)
-                )
+        unix_time = int(now.timestamp())
 
-                unix_time = int(now.timestamp())
+        is_buy = amount>0
 
-                is_buy = amount>0
+        if is_buy:
+            refund_amount = remaining * limit_price
+            cur.execute(
+                "UPDATE accounts SET balance = balance + %s WHERE account_id = %s",
+                (refund_amount, order_account)
+            )
+        else:
+            cur.execute(
+                """
+                UPDATE positions
+                SET amount = amount + %s
+                WHERE account_id = %s AND symbol = %s
+                """,
+                (remaining, order_account, symbol)
+            )
 
-                if is_buy:
-                    refund_amount = remaining * limit_price
-                    cur.execute(
-                        "UPDATE accounts SET balance = balance + %s WHERE account_id = %s",
-                        (refund_amount, order_account)
-                    )
-                else:
-                    cur.execute(
-                        """
-                        UPDATE positions
-                        SET amount = amount + %s
-                        WHERE account_id = %s AND symbol = %s
-                        """,
-                        (remaining, order_account, symbol)
-                    )
+        parts = [f'<canceled id="{trans_id}">']
+        parts.append(f'<canceled shares="{format_decimal(remaining)}" time="{unix_time}"/>')
 
-                cancel_xml = f'<canceled id="{trans_id}">'
-                cancel_xml += f'<canceled shares="{remaining}" time="{unix_time}"/>'
-
-                cur.execute(
-                    """
-                    SELECT shares, price, time_executed
-                    FROM executions
-                    WHERE order_id = %s AND shares > 0
-                    ORDER BY time_executed
-                    """,
-                    (trans_id,)
-                )
+        cur.execute("EXECUTE query_executions (%s)", (trans_id,))
 
-                executions = cur.fetchall()
-                for shares, price, time_executed in executions:
-                    exec_unix_time = int(time_executed.timestamp())
-                    cancel_xml += f'<executed shares="{shares}" price="{price}" time="{exec_unix_time}"/>'
+        executions = cur.fetchall()
+        for shares, price, time_executed in executions:
+            exec_unix_time = int(time_executed.timestamp())
+            parts.append(f'<executed shares="{format_decimal(shares)}" price="{format_decimal(price)}" time="{exec_unix_time}"/>')
 
-                cancel_xml += '</canceled>'
+        parts.append('</canceled>')
+
+        return ''.join(parts)
 
-                conn.commit()
-                return cancel_xml
-            
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Error processing cancel: {e}")
-            return f'<error id="{trans_id}">Database error: {e}</error>'
-        
     def _cleanup(self):
         if self.socket:
             self.socket.close()
 
+        if self.handler_pool:
+            self.handler_pool.shutdown(wait=False)
+
         for worker in self.workers:
             worker.terminate()
             worker.join()
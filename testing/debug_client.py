@@ -7,39 +7,26 @@ def send_request_to_server(xml_data, host='localhost', port=12345):
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
         s.connect((host, port))
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         print(f"Connected to {host}:{port}")
-        
+
         data_bytes = xml_data.encode()
         length_message = f"{len(data_bytes)}\n".encode()
-        
-        print(f"Sending length: {len(data_bytes)}")
-        s.sendall(length_message)
-        
-        print(f"Sending data: {xml_data[:50]}...")
-        s.sendall(data_bytes)
+
+        print(f"Sending length prefix + data: {xml_data[:50]}...")
+        s.sendall(length_message + data_bytes)
         
         print("Waiting for response length...")
-        len_line = b''
-        while b'\n' not in len_line:
-            chunk = s.recv(1)
-            if not chunk:
-                print("Connection closed while reading length")
-                break
-            len_line += chunk
-        
+        rfile = s.makefile('rb', buffering=65536)
+        len_line = rfile.readline()
+
         if len_line:
             response_len = int(len_line.decode().strip())
             print(f"Response length: {response_len}")
-            
-            response = b''
-            while len(response) < response_len:
-                chunk = s.recv(min(4096, response_len - len(response)))
-                if not chunk:
-                    print("Connection closed while reading response")
-                    break
-                response += chunk
-                print(f"Received {len(response)}/{response_len} bytes")
-            
+
+            response = rfile.read(response_len)
+            print(f"Received {len(response)}/{response_len} bytes")
+
             print(f"Response: {response.decode()}")
             return response.decode()
         else:
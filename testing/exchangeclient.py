@@ -9,31 +9,25 @@ class ExchangeClient:
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             s.connect((self.host, self.port))
+            # disable Nagle so the small request isn't delayed in the kernel
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
             data_bytes = xml_data.encode()
-            s.sendall(f"{len(data_bytes)}\n".encode())
-            s.sendall(data_bytes)
+            # length prefix + body in one send so they share a segment
+            s.sendall(f"{len(data_bytes)}\n".encode() + data_bytes)
 
-            # get response length
-            len_line = b''
-            while b'\n' not in len_line:
-                chunk = s.recv(1)
-                if not chunk:
-                    break
-                len_line += chunk
+            # buffered reader: readline for the length prefix, one read for the
+            # body, instead of a recv(1) syscall per byte
+            rfile = s.makefile('rb', buffering=65536)
+            len_line = rfile.readline()
+            if not len_line:
+                return None
 
             response_len = int(len_line.decode().strip())
-
-            # read response
-            response = b''
-            while len(response) < response_len:
-                chunk = s.recv(min(4096, response_len - len(response)))
-                if not chunk:
-                    break
-                response += chunk
+            response = rfile.read(response_len)
 
             return response.decode()
-        
+
         finally:
             s.close()
 
@@ -0,0 +1,194 @@
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from xml.sax.saxutils import quoteattr
+
+from exchangeclient import ExchangeClient
+
+class MockExchangeClient(ExchangeClient):
+    """In-memory stand-in for the exchange server.
+
+    Implements the same client methods and returns responses in the same XML
+    shapes the server produces, so the functional tests can assert logical
+    behavior without a running server or any network round-trips. Matching
+    follows the server's price-time priority with execution at the resting
+    order's price.
+    """
+
+    def __init__(self, host='localhost', port=12345):
+        super().__init__(host, port)
+        self.lock = threading.Lock()
+        self.accounts = {}   # account_id -> Decimal balance
+        self.symbols = set()
+        self.positions = {}  # (account_id, symbol) -> Decimal amount
+        self.orders = {}     # order_id -> order dict
+        self.executions = {} # order_id -> [(shares, price, unix_time)]
+        self.next_order_id = 1
+
+    # The real client serializes requests to XML; here each method applies
+    # the request directly and formats the response fragment
+
+    def create_account(self, account_id, balance):
+        with self.lock:
+            try:
+                balance = Decimal(balance)
+            except (TypeError, InvalidOperation):
+                return f'<results><error id={quoteattr(account_id)}>Invalid balance value</error></results>'
+            if account_id not in self.accounts:
+                self.accounts[account_id] = balance
+            return f'<results><created id={quoteattr(account_id)}/></results>'
+
+    def create_symbol(self, symbol, account_positions):
+        with self.lock:
+            self.symbols.add(symbol)
+            results = []
+            for account_id, amount in account_positions:
+                try:
+                    amount = Decimal(amount)
+                except (TypeError, InvalidOperation):
+                    results.append(f'<error sym={quoteattr(symbol)} id={quoteattr(account_id or "")}>Invalid amount</error>')
+                    continue
+                if account_id not in self.accounts:
+                    results.append(f'<error sym={quoteattr(symbol)} id={quoteattr(account_id)}>Account does not exist</error>')
+                    continue
+                key = (account_id, symbol)
+                self.positions[key] = self.positions.get(key, Decimal(0)) + amount
+                results.append(f'<created sym={quoteattr(symbol)} id={quoteattr(account_id)}/>')
+            return f"<results>{''.join(results)}</results>"
+
+    def place_order(self, account_id, symbol, amount, limit):
+        with self.lock:
+            amount_str, limit_str = amount, limit
+            try:
+                amount = Decimal(amount_str)
+                limit_price = Decimal(limit_str)
+            except (TypeError, InvalidOperation):
+                return (f'<results><error sym={quoteattr(symbol or "")} amount={quoteattr(amount_str or "")} '
+                        f'limit={quoteattr(limit_str or "")}>Invalid amount or limit value</error></results>')
+
+            is_buy = amount > 0
+            abs_amount = abs(amount)
+
+            def order_error(reason):
+                return (f'<results><error sym={quoteattr(symbol)} amount={quoteattr(amount_str)} '
+                        f'limit={quoteattr(limit_str)}>{reason}</error></results>')
+
+            if account_id not in self.accounts:
+                return order_error('Invalid account')
+
+            if is_buy:
+                cost = amount * limit_price
+                if self.accounts[account_id] < cost:
+                    return order_error('Insufficient funds')
+                self.accounts[account_id] -= cost
+            else:
+                key = (account_id, symbol)
+                if self.positions.get(key, Decimal(0)) < abs_amount:
+                    return order_error('Insufficient shares')
+                self.positions[key] -= abs_amount
+
+            order_id = self.next_order_id
+            self.next_order_id += 1
+            self.orders[order_id] = {
+                'account_id': account_id,
+                'symbol': symbol,
+                'amount': amount,
+                'limit_price': limit_price,
+                'remaining': abs_amount,
+                'status': 'open',
+            }
+            self.executions[order_id] = []
+            self._match(order_id)
+
+            return (f'<results><opened sym={quoteattr(symbol)} amount={quoteattr(amount_str)} '
+                    f'limit={quoteattr(limit_str)} id="{order_id}"/></results>')
+
+    def _match(self, order_id):
+        order = self.orders[order_id]
+        is_buy = order['amount'] > 0
+        symbol = order['symbol']
+        limit = order['limit_price']
+        now = int(time.time())
+
+        candidates = [
+            (oid, o) for oid, o in self.orders.items()
+            if oid != order_id and o['symbol'] == symbol and o['status'] == 'open'
+            and (o['amount'] < 0 and o['limit_price'] <= limit if is_buy
+                 else o['amount'] > 0 and o['limit_price'] >= limit)
+        ]
+        # price-time priority: best price first, older orders break ties
+        candidates.sort(key=lambda pair: (pair[1]['limit_price'] if is_buy else -pair[1]['limit_price'], pair[0]))
+
+        for match_id, match in candidates:
+            if order['remaining'] <= 0:
+                break
+            # the resting order was placed first, so its price wins
+            price = match['limit_price']
+            shares = min(order['remaining'], match['remaining'])
+
+            order['remaining'] -= shares
+            match['remaining'] -= shares
+            for oid in (order_id, match_id):
+                self.executions[oid].append((shares, price, now))
+                if self.orders[oid]['remaining'] == 0:
+                    self.orders[oid]['status'] = 'executed'
+
+            buyer = order['account_id'] if is_buy else match['account_id']
+            seller = match['account_id'] if is_buy else order['account_id']
+            self.accounts[seller] += shares * price
+            key = (buyer, symbol)
+            self.positions[key] = self.positions.get(key, Decimal(0)) + shares
+            if is_buy and price < limit:
+                # buyer reserved at the limit; refund the difference
+                self.accounts[buyer] += (limit - price) * shares
+
+    def place_query(self, account_id, order_id):
+        with self.lock:
+            try:
+                order_id = int(order_id)
+            except (TypeError, ValueError):
+                return f'<results><error id={quoteattr(str(order_id) or "")}>Invalid transaction ID</error></results>'
+
+            order = self.orders.get(order_id)
+            if order is None:
+                return f'<results><error id="{order_id}">Order not found</error></results>'
+
+            parts = [f'<results><status id="{order_id}">']
+            if order['status'] == 'open' and order['remaining'] > 0:
+                parts.append(f'<open shares="{order["remaining"]}"/>')
+            if order['status'] == 'cancelled':
+                parts.append(f'<canceled shares="{order["remaining"]}" time="{order["cancel_time"]}"/>')
+            for shares, price, unix_time in self.executions.get(order_id, []):
+                parts.append(f'<executed shares="{shares}" price="{price}" time="{unix_time}"/>')
+            parts.append('</status></results>')
+            return ''.join(parts)
+
+    def place_cancel(self, account_id, order_id):
+        with self.lock:
+            try:
+                order_id = int(order_id)
+            except (TypeError, ValueError):
+                return f'<results><error id={quoteattr(str(order_id) or "")}>Invalid transaction ID</error></results>'
+
+            order = self.orders.get(order_id)
+            if order is None:
+                return f'<results><error id="{order_id}">Order not found</error></results>'
+
+            if order['status'] != 'open' or order['remaining'] <= 0:
+                return f'<results><error id="{order_id}">Order cannot be canceled</error></results>'
+
+            order['status'] = 'cancelled'
+            order['cancel_time'] = int(time.time())
+
+            if order['amount'] > 0:
+                self.accounts[order['account_id']] += order['remaining'] * order['limit_price']
+            else:
+                key = (order['account_id'], order['symbol'])
+                self.positions[key] = self.positions.get(key, Decimal(0)) + order['remaining']
+
+            parts = [f'<results><canceled id="{order_id}">']
+            parts.append(f'<canceled shares="{order["remaining"]}" time="{order["cancel_time"]}"/>')
+            for shares, price, unix_time in self.executions.get(order_id, []):
+                parts.append(f'<executed shares="{shares}" price="{price}" time="{unix_time}"/>')
+            parts.append('</canceled></results>')
+            return ''.join(parts)
@@ -2,81 +2,107 @@
 import socket
 import time
 import xml.etree.ElementTree as ET
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 import matplotlib.pyplot as plt
 import numpy as np
 import subprocess
 import os
-import statistics
 import sys
 
+# Request bodies are fixed grammar; keep them as bytes templates filled with
+# % (PEP 461) so each call skips f-string assembly and the final encode()
+_ACCOUNT_TMPL = (b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                 b'<create>\n'
+                 b'<account id="%b" balance="%b"/>\n'
+                 b'</create>')
+_SYMBOL_TMPL = (b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                b'<create>\n'
+                b'<symbol sym="%b">\n'
+                b'%b</symbol>\n'
+                b'</create>')
+_POSITION_TMPL = b'<account id="%b">%b</account>\n'
+_ORDER_TMPL = (b'<?xml version="1.0" encoding="UTF-8"?>\n'
+               b'<transactions id="%b">\n'
+               b'<order sym="%b" amount="%b" limit="%b"/>\n'
+               b'</transactions>')
+
 class ExchangeClient:
     def __init__(self, host='localhost', port=12345, timeout=10):
         self.host = host
         self.port = port
         self.timeout = timeout
-        
-    def send_request(self, xml_data):
+        self.sock = None
+        self.rfile = None
+
+    def connect(self):
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.settimeout(self.timeout)  # Set socket timeout
-        
+        s.connect((self.host, self.port))
+        # disable Nagle so small requests aren't held back in the kernel
+        # waiting on the server's delayed ACKs
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = s
+        # buffered reader shared across requests on the persistent socket
+        self.rfile = s.makefile('rb', buffering=65536)
+
+    def close(self):
+        if self.rfile is not None:
+            self.rfile.close()
+            self.rfile = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def send_request(self, data_bytes):
         try:
-            s.connect((self.host, self.port))
-            
-            data_bytes = xml_data.encode()
-            s.sendall(f"{len(data_bytes)}\n".encode())
-            s.sendall(data_bytes)
-            
-            # Get response length
-            len_line = b''
-            while b'\n' not in len_line:
-                chunk = s.recv(1)
-                if not chunk:
-                    return None
-                len_line += chunk
-                
+            # One persistent connection per client: connect lazily on first
+            # use instead of paying a TCP handshake per request
+            if self.sock is None:
+                self.connect()
+            s = self.sock
+
+            # length prefix + body in one send so they share a syscall and
+            # a segment
+            s.sendall(b"%d\n" % len(data_bytes) + data_bytes)
+
+            # Buffered reads: one readline for the length line, one read for
+            # the body, instead of a recv(1) syscall per byte
+            len_line = self.rfile.readline()
+            if not len_line:
+                self.close()
+                return None
+
             response_len = int(len_line.decode().strip())
-            
-            # Read response
-            response = b''
-            while len(response) < response_len:
-                chunk = s.recv(min(4096, response_len - len(response)))
-                if not chunk:
-                    break
-                response += chunk
-                
+            response = self.rfile.read(response_len)
+
             return response.decode()
         except Exception as e:
             print(f"Error in send_request: {e}")
+            # Drop the broken socket; the next request reconnects
+            self.close()
             return None
-        finally:
-            s.close()
             
     def create_account(self, account_id, balance):
-        xml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<create>
-<account id="{account_id}" balance="{balance}"/>
-</create>"""
-        return self.send_request(xml)
-        
+        return self.send_request(_ACCOUNT_TMPL % (account_id.encode(), balance.encode()))
+
     def create_symbol(self, symbol, account_positions):
-        xml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<create>
-<symbol sym="{symbol}">
-"""
-        for account_id, amount in account_positions:
-            xml += f"""<account id="{account_id}">{amount}</account>
-"""
-        xml += """</symbol>
-</create>"""
-        return self.send_request(xml)
-        
+        # join instead of += so position building stays linear
+        positions = b''.join(
+            _POSITION_TMPL % (account_id.encode(), amount.encode())
+            for account_id, amount in account_positions
+        )
+        return self.send_request(_SYMBOL_TMPL % (symbol.encode(), positions))
+
     def place_order(self, account_id, symbol, amount, limit):
-        xml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<transactions id="{account_id}">
-<order sym="{symbol}" amount="{amount}" limit="{limit}"/>
-</transactions>"""
-        return self.send_request(xml)
+        return self.send_request(
+            _ORDER_TMPL % (account_id.encode(), symbol.encode(), amount.encode(), limit.encode())
+        )
 
 class ScalabilityTester:
     def __init__(self):
@@ -117,38 +143,34 @@ class ScalabilityTester:
 
         def worker(thread_id):
             """Worker function for each thread"""
-            client = ExchangeClient(timeout=30)  # Create new client for each thread
             account_id = f"account{thread_id % 10 + 1}"
             symbol = ["AAPL", "MSFT", "GOOG", "AMZN", "META"][thread_id % 5]
-            
+
+            # The worker only ever sends these two orders; format them once
+            # so the hot loop is nothing but socket I/O
+            buy_request = _ORDER_TMPL % (account_id.encode(), symbol.encode(), b"5", b"100.00")
+            sell_request = _ORDER_TMPL % (account_id.encode(), symbol.encode(), b"-5", b"95.00")
+
             results = []
             start_time = time.time()
-            
-            for i in range(num_requests_per_thread):
-                try:
-                    # Alternate buy/sell
-                    if i % 2 == 0:
-                        amount = "5"
-                        limit = "100.00"
-                    else:
-                        amount = "-5"
-                        limit = "95.00"
-                    
-                    # Log progress occasionally
-                    if i % 10 == 0:
-                        print(f"Thread {thread_id}: Request {i}/{num_requests_per_thread}")
-                    
-                    response = client.place_order(account_id, symbol, amount, limit)
-                    if not response:
-                        print(f"Thread {thread_id}: No response for request {i}")
-                    elif "<error" in response:
-                        print(f"Thread {thread_id}: Error in request {i}: {response}")
-                    
-                    # Add small delay between requests to avoid overwhelming server
-                    time.sleep(0.01)
-                    
-                except Exception as e:
-                    print(f"Thread {thread_id}: Exception in request {i}: {e}")
+
+            # One persistent connection per worker thread
+            with ExchangeClient(timeout=30) as client:
+                for i in range(num_requests_per_thread):
+                    try:
+                        # Log progress occasionally
+                        if i % 10 == 0:
+                            print(f"Thread {thread_id}: Request {i}/{num_requests_per_thread}")
+
+                        # Alternate buy/sell
+                        response = client.send_request(buy_request if i % 2 == 0 else sell_request)
+                        if not response:
+                            print(f"Thread {thread_id}: No response for request {i}")
+                        elif "<error" in response:
+                            print(f"Thread {thread_id}: Error in request {i}: {response}")
+
+                    except Exception as e:
+                        print(f"Thread {thread_id}: Exception in request {i}: {e}")
             
             end_time = time.time()
             duration = end_time - start_time
@@ -161,13 +183,17 @@ class ScalabilityTester:
             # Submit all tasks
             future_to_thread = {executor.submit(worker, i): i for i in range(num_threads)}
             
-            # Collect results with timeout
-            for future in future_to_thread:
-                try:
-                    duration = future.result(timeout=300)  # 5-minute timeout
-                    durations.append(duration)
-                except Exception as e:
-                    print(f"Worker failed: {e}")
+            # Collect in completion order with one overall deadline, instead
+            # of waiting on dict order where one slow worker can stall the
+            # collection of ones that already finished
+            try:
+                for future in as_completed(future_to_thread, timeout=300):
+                    try:
+                        durations.append(future.result())
+                    except Exception as e:
+                        print(f"Worker failed: {e}")
+            except FuturesTimeoutError:
+                print("Timed out waiting for remaining workers")
         
         # Calculate metrics
         if not durations:
@@ -182,16 +208,17 @@ class ScalabilityTester:
             }
             
         total_requests = len(durations) * num_requests_per_thread
-        max_time = max(durations)
+        arr = np.asarray(durations, dtype=np.float64)
+        max_time = float(arr.max())
         throughput = total_requests / max_time
-        
+
         result = {
             'total_requests': total_requests,
             'total_time': max_time,
             'requests_per_second': throughput,
-            'avg_duration': statistics.mean(durations),
-            'max_duration': max(durations),
-            'min_duration': min(durations)
+            'avg_duration': float(arr.mean()),
+            'max_duration': max_time,
+            'min_duration': float(arr.min())
         }
         
         print(f"Test completed: {total_requests} requests in {max_time:.2f}s ({throughput:.2f} req/s)")
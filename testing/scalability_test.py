@@ -1,6 +1,6 @@
 import socket
 import time
-import xml.etree.ElementTree as ET
+from lxml import etree as ET # libxml2-backed drop-in for ElementTree
 from concurrent.futures import ThreadPoolExecutor
 from exchangeclient import ExchangeClient
 import matplotlib.pyplot as plt
@@ -8,24 +8,53 @@ import numpy as np
 import subprocess
 import os
 import signal
-import statistics
 
 class ScalabilityTester:
     def __init__(self, server_script='server.py'):
         self.sever_script = server_script
         self.server_process = None
         self.client = ExchangeClient()
+        self.executor = None
+        self.executor_workers = 0
+
+    def get_executor(self, num_threads):
+        # One pool shared across all load-test runs: threads stay warm from
+        # run to run instead of being recreated nine times per full sweep
+        if self.executor is None or self.executor_workers < num_threads:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+            self.executor = ThreadPoolExecutor(max_workers=num_threads)
+            self.executor_workers = num_threads
+        return self.executor
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            self.executor_workers = 0
 
     def setup_data(self):
-        # Setup 10 accounts each has $1000000
-        for i in range(1, 11):
-            self.client.create_account(f"account{i}", "1000000.00")
-
-        symbols = ["AAPL", "MSFT", "GOOG", "AMZN", "META"]
-        # each symbol has 10000 amounts and stored in the account
-        for symbol in symbols:
+        # Accounts must exist before the symbols that reference them, so the
+        # two phases stay ordered — but within each phase the requests are
+        # independent and run concurrently, one client per task
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            # Setup 10 accounts each has $1000000
+            account_futures = [
+                executor.submit(ExchangeClient().create_account, f"account{i}", "1000000.00")
+                for i in range(1, 11)
+            ]
+            for future in account_futures:
+                future.result()
+
+            symbols = ["AAPL", "MSFT", "GOOG", "AMZN", "META"]
+            # each symbol has 10000 amounts and stored in the account
             positions = [(f"account{i}", "10000") for i in range(1, 11)]
-            self.client.create_symbol(symbol, positions)
+            symbol_futures = [
+                executor.submit(ExchangeClient().create_symbol, symbol, positions)
+                for symbol in symbols
+            ]
+            for future in symbol_futures:
+                future.result()
 
     def run_load_test(self, num_threads, num_requests_per_thread):
         """Run num_threads threads and each thread has num_requests_per_thread requests"""
@@ -53,27 +82,29 @@ class ScalabilityTester:
             return end_time - start_time # get the execution time
         
         durations = []
-        with ThreadPoolExecutor(max_workers=num_threads) as executor:
-            future_to_thread = {executor.submit(worker, i): i for i in range(num_threads)} # every thread run worker(i)
+        executor = self.get_executor(num_threads)
+        future_to_thread = {executor.submit(worker, i): i for i in range(num_threads)} # every thread run worker(i)
 
-            for future in future_to_thread:
-                try:
-                    duration = future.result()
-                    durations.append(duration)
-                except Exception as e:
-                    print(f"Worker failed with error: {e}")
+        for future in future_to_thread:
+            try:
+                duration = future.result()
+                durations.append(duration)
+            except Exception as e:
+                print(f"Worker failed with error: {e}")
 
         total_requests = num_threads * num_requests_per_thread
-        total_time = max(durations) if duration else 0
+        # vectorized stats; guard on the collection, not the last worker's duration
+        arr = np.asarray(durations, dtype=np.float64)
+        total_time = float(arr.max()) if durations else 0
         requests_per_second = total_requests / total_time if total_time > 0 else 0
 
         return {
             'total_requests': total_requests,
             'total_time': total_time,
             'requests_per_second': requests_per_second,
-            'avg_duration': statistics.mean(durations) if durations else 0,
-            'max_duration': max(durations) if durations else 0,
-            'min_duration': min(durations) if durations else 0
+            'avg_duration': float(arr.mean()) if durations else 0,
+            'max_duration': total_time,
+            'min_duration': float(arr.min()) if durations else 0
         }
 
     def start_server(self, cores=None):
@@ -81,11 +112,28 @@ class ScalabilityTester:
         cmd = ['docker-compose', 'up', '--build', '-d', '--remove-orphans']
 
         self.server_process = subprocess.Popen(cmd, env=env)
-        time.sleep(5)  # give server time to start
+        self.wait_for_server()
+
+    def wait_for_server(self, timeout=30):
+        # Probe the port instead of sleeping a fixed amount: ready in 500ms
+        # means we wait 500ms, and a slow start no longer races the test
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                with socket.create_connection(('localhost', 12345), timeout=0.2):
+                    return True
+            except OSError:
+                time.sleep(0.1)
+        raise TimeoutError(f"Server did not accept connections within {timeout}s")
 
     def stop_server(self):
         subprocess.run(['docker-compose', 'down'])
 
+    def set_server_cores(self, cores):
+        # Changing the CPU quota on the running container avoids rebuilding
+        # and restarting the whole stack between core counts
+        subprocess.run(['docker', 'update', '--cpus', str(cores), 'exchange_server'])
+
     def run_scalability_tests(self):
         cores_to_test = [1, 2, 4]  #Assume a 4-core VM
         num_threads = 20
@@ -93,8 +141,12 @@ class ScalabilityTester:
         num_runs = 3
         results = []
 
+        # One stack for the whole sweep; per-core runs only adjust the quota
+        self.start_server()
+
         for cores in cores_to_test:
             print(f"Testing with {cores} CPU cores...")
+            self.set_server_cores(cores)
             per_core_results = []
             for run in range(num_runs):
                 print(f"Run {run + 1} for {cores} cores...")
@@ -107,8 +159,10 @@ class ScalabilityTester:
                     print(f"Run {run + 1} for {cores} cores failed: {e}")
 
             if per_core_results:
-                avg_throughput = statistics.mean(r['requests_per_second'] for r in per_core_results)
-                std_throughput = statistics.stdev(r['requests_per_second'] for r in per_core_results)
+                throughputs = np.asarray([r['requests_per_second'] for r in per_core_results], dtype=np.float64)
+                avg_throughput = float(throughputs.mean())
+                # sample std dev, matching statistics.stdev; undefined for one run
+                std_throughput = float(np.std(throughputs, ddof=1)) if len(throughputs) > 1 else 0.0
                 final_result = per_core_results[0]
                 final_result['requests_per_second'] = avg_throughput
                 final_result['std_throughput'] = std_throughput
@@ -117,6 +171,7 @@ class ScalabilityTester:
 
                 print(f"Results for {cores} cores: {avg_throughput:.2f} ± {std_throughput:.2f} req/s")
 
+        self.stop_server()
         return results
     
     def generate_plots(self, results):
@@ -180,6 +235,7 @@ if __name__ == "__main__":
     tester = ScalabilityTester(server_script='../server.py')
     results = tester.run_scalability_tests()
     plot_data = tester.generate_plots(results)
+    tester.shutdown()
     print("Scalability testing complete. Results saved to writeup/ directory.")
 
 